@@ -13,7 +13,8 @@ from web_app.app import app
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
-    debug_mode = os.environ.get('DEBUG', 'False').lower() == 'true'
+    # Dev server only; production runs gunicorn via wsgi.py
+    debug_mode = os.environ.get('FLASK_ENV') == 'development'
 
     print("=" * 60)
     print(" TRANSTAR-NAGEL WEB INTERFACE ".center(60))
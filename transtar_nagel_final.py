@@ -8,18 +8,32 @@ TRANSTAR-NAGEL FINAL SYSTEM v4.0
 import os
 import re
 import sys
+import functools
+import pickle
 import hashlib
+import tempfile
+import time
 import logging
+import multiprocessing
+import numpy as np
 import pandas as pd
 import pdfplumber
+import xlsxwriter
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterator, Optional, Tuple
 from collections import defaultdict
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
 # ═══════════════════════════════════════════════════════════════════
 #                         КОНФИГУРАЦИЯ
 # ═══════════════════════════════════════════════════════════════════
@@ -34,11 +48,320 @@ logging.basicConfig(
 )
 logger = logging.getLogger('TRANSTAR-FINAL')
 
+# ═══════════════════════════════════════════════════════════════════
+#                    РЕГУЛЯРНЫЕ ВЫРАЖЕНИЯ
+# ═══════════════════════════════════════════════════════════════════
+
+# Транспортный заказ
+_RE_ORDER_NUMBER = re.compile(r'TRN-(\d{4}\s?\d{2})')
+_RE_DATE = re.compile(r'Datum:\s*(\d{2}\.\d{2}\.\d{4})')
+_RE_VEHICLE = re.compile(r'LKW-Kennzeichen:\s*([A-Z\s\-]+\d+)')
+_RE_KM = re.compile(r'//(\d+)\s*LEERKM\s*//(\d+)\s*LAST\s*KM')
+_RE_PERCENT = re.compile(r'//\s*(\d+)%')
+_RE_PRICE = re.compile(r'Frachtpreis:.*?Maut:.*?(\d+[,\.]\d+)\s*EUR\s+(\d+[,\.]\d+)\s*EUR', re.DOTALL)
+_RE_LOAD = re.compile(r'Ladestellen[^:]*:\s*(.*?)(?=\(Die vorgegebenen|Ladung:|$)', re.DOTALL)
+_RE_UNLOAD = re.compile(r'Empfänger[^:]*:\s*(.*?)(?=Frachtpreis|Zahlungsziel|$)', re.DOTALL)
+# Компания, улица, индекс и (необязательно) город - первый адрес в каждой строке
+_RE_ADDRESS = re.compile(
+    r'^[^\n]*?(?P<company>[A-Z](?:[\w\-&\.]|[^\S\n])+?),[^\S\n]*(?P<street>[^,\n]+),[^\S\n]*D[^\S\n]*(?P<plz>\d{5})'
+    r'(?:[^\S\n]*(?P<city>[A-Z][A-Z\-]*))?',
+    re.MULTILINE
+)
+# Конец списка Ladestellen: пустая строка или служебный текст
+_RE_LOAD_END = re.compile(r'^[^\S\n]*$|^.*Die vorgegebenen', re.MULTILINE)
+_RE_LEER_IN = re.compile(r'LEER IN\s+([A-Z\-]+)')
+_RE_INSTRUCTION = re.compile(r'LADEINSTRUKTIONEN:.*?(?=A\.|$)', re.DOTALL)
+_RE_CITY = re.compile(r'D\s*\d{5}\s+([A-Z\-]+)')
+# Заголовки секций адресов и их окончания (как в _RE_LOAD и _RE_UNLOAD)
+_ORDER_SECTIONS = (
+    (re.compile(r'Ladestellen[^:]*:'), re.compile(r'\(Die vorgegebenen|Ladung:')),
+    (re.compile(r'Empfänger[^:]*:'), re.compile(r'Frachtpreis|Zahlungsziel')),
+)
+
+# Гутшрифт
+_RE_NUMBER = re.compile(r'Nr\.:\s*(\d+)')
+_RE_DATE_GS = re.compile(r'vom:\s*(\d{2}\.\d{2}\.\d{4})')
+_RE_PERIOD = re.compile(r'Leistungszeitraum:\s*(\d{2}\.\d{2}\.\d{4})\s*-\s*(\d{2}\.\d{2}\.\d{4})')
+_RE_TOTAL_FREIGHT = re.compile(r'Fracht\s+ST\s+[\d,\.]+\s+([\d,\.]+)')
+_RE_TOTAL_MAUT = re.compile(r'Mautkosten.*?ST\s+[\d,\.]+\s+([\d,\.]+)')
+_RE_GROSS = re.compile(r'Gesamtbetrag:\s*([\d,\.]+)\s*EUR')
+_RE_ORDER_COUNT = re.compile(r'Anzahl.*?Transportaufträge.*?:\s*(\d+)')
+# Блоки детализации разбираются по отдельности: текст режется по маркеру
+# Transp.A., и _RE_DETAIL применяется к началу каждого блока
+_RE_DETAIL_SPLIT = re.compile(r'Transp\.A\.')
+_RE_DETAIL = re.compile(
+    r'\s+.*?\n.*?\n(\d{6})\s+(\d{2}\.\d{2}\.\d{4}).*?([A-Z\s\-]+\d+)'
+    r'.*?Fracht.*?D\s+[\d,]+\s+([\d,\.]+)\s+EUR'
+    r'.*?Mautkosten.*?D\s+[\d,]+\s+([\d,\.]+)\s+EUR'
+    r'.*?Summe\s+([\d,\.]+)\s+EUR',
+    re.DOTALL
+)
+
+# Версия формата кэша разобранных PDF - увеличивать при изменении структур данных
+_CACHE_VERSION = 3
+
+# Ограничения кэша: записи старше срока и самые давние сверх объема удаляются
+_CACHE_MAX_AGE = 30 * 24 * 3600  # секунды
+_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Минимальное число файлов для параллельного парсинга в пуле процессов
+_PARALLEL_MIN_FILES = 4
+
+# Воркеры пула запускаются через forkserver/spawn, а не fork: пул создается и из
+# многопоточного веб-процесса, где fork может унести в потомка захваченные блокировки
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+if _POOL_CONTEXT.get_start_method() == 'forkserver':
+    # Модуль (pandas, pdfplumber, xlsxwriter) импортируется один раз в сервере форков,
+    # воркеры получают его готовым, без повторного импорта на каждую задачу
+    _POOL_CONTEXT.set_forkserver_preload([__name__])
+
+# Поля, после нахождения которых дальнейшие страницы PDF не читаются
+_ORDER_REQUIRED = (_RE_ORDER_NUMBER, _RE_DATE, _RE_VEHICLE, _RE_KM, _RE_PERCENT, _RE_PRICE)
+# Поля шапки гутшрифта (ищутся постранично, пока не найдены)
+_GUTSCHRIFT_HEADER = (
+    _RE_NUMBER, _RE_DATE_GS, _RE_PERIOD, _RE_TOTAL_FREIGHT, _RE_TOTAL_MAUT, _RE_GROSS, _RE_ORDER_COUNT
+)
+
+def _parse_loading_points(text: str) -> List[str]:
+    """Полные адреса (компания, улица, индекс и город) из секции Ladestellen"""
+    points = []
+    if loading_section := _RE_LOAD.search(text):
+        section = loading_section.group(1).strip()
+        if end := _RE_LOAD_END.search(section):
+            section = section[:end.start()]
+
+        # Ищем полные адреса по строкам
+        for match in _RE_ADDRESS.finditer(section):
+            company = match['company'].strip()
+            street = match['street'].strip()
+            city = match['city'] or ""
+            points.append(f"{company}, {street}, D {match['plz']} {city}".strip())
+
+    return points
+
+class _OrderPages:
+    """Постраничный сбор текста заказа с проверкой ранней остановки.
+
+    Каждая страница проверяется один раз, найденные поля запоминаются флагами;
+    общий текст документа собирается один раз в text().
+    """
+
+    def __init__(self):
+        self.pages: List[str] = []
+        self.missing = list(_ORDER_REQUIRED)
+        # Страница с заголовком каждой секции адресов (None - не найден) и признак ее закрытия
+        self.section_pages: List[Optional[int]] = [None] * len(_ORDER_SECTIONS)
+        self.section_closed = [False] * len(_ORDER_SECTIONS)
+        self.has_leer_in = False
+        self.loading_points: Optional[List[str]] = None
+
+    def add(self, page_text: str) -> bool:
+        """Добавление страницы; True - следующие страницы уже не изменят результат разбора"""
+        page_no = len(self.pages)
+        self.pages.append(page_text)
+
+        self.missing = [pattern for pattern in self.missing if not pattern.search(page_text)]
+        self.has_leer_in = self.has_leer_in or bool(_RE_LEER_IN.search(page_text))
+
+        # Секция закрыта, когда после ее заголовка встретилось окончание
+        for i, (start, end) in enumerate(_ORDER_SECTIONS):
+            if self.section_closed[i]:
+                continue
+            pos = 0
+            if self.section_pages[i] is None:
+                if not (match := start.search(page_text)):
+                    continue
+                self.section_pages[i] = page_no
+                pos = match.end()
+            self.section_closed[i] = bool(end.search(page_text, pos))
+
+        # Адреса Ladestellen (первая из _ORDER_SECTIONS) разбираем один раз - после закрытия секции
+        if self.loading_points is None and self.section_closed[0]:
+            self.loading_points = _parse_loading_points("\n".join(self.pages[self.section_pages[0]:]))
+
+        # Без адресов в Ladestellen точку загрузки берем из LEER IN, который может быть дальше
+        return (
+            not self.missing
+            and all(self.section_closed)
+            and (self.has_leer_in or bool(self.loading_points))
+        )
+
+    def text(self) -> str:
+        """Полный текст прочитанных страниц"""
+        return "\n".join(self.pages)
+
+def _is_order_parsed(text: str, order: Optional['TransportOrder']) -> bool:
+    """Разбор заказа полный: есть все обязательные поля и точки загрузки/разгрузки"""
+    return (
+        order is not None
+        and all(pattern.search(text) for pattern in _ORDER_REQUIRED)
+        and bool(order.loading_points)
+        and bool(order.unloading_points)
+    )
+
+def _is_gutschrift_parsed(header: Dict, details: List[Tuple[str, ...]]) -> bool:
+    """Разбор гутшрифта полный: найден номер и детализация всех заказов"""
+    if header[_RE_NUMBER] is None:
+        return False
+    count = header[_RE_ORDER_COUNT]
+    return count is None or len(details) >= int(count.group(1))
+
+def _match_details(chunks: List[str]) -> Iterator[Tuple[str, ...]]:
+    """Группы _RE_DETAIL по блокам Transp.A. гутшрифта:
+    (заказ, дата, машина, фрахт, маут, сумма)"""
+    for chunk in chunks:
+        if match := _RE_DETAIL.match(chunk):
+            yield match.groups()
+
+def _file_digest(path: Path) -> str:
+    """SHA-256 содержимого файла потоком, без чтения PDF целиком в память"""
+    with open(path, 'rb') as f:
+        # hashlib.file_digest (Python 3.11+) хэширует в C и отпускает GIL
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        while block := f.read(1 << 20):
+            digest.update(block)
+        return digest.hexdigest()
+
+def _extract_pages(pdf_path: Path, use_pdfium: bool = True) -> Iterator[str]:
+    """Постраничное извлечение текста: pypdfium2, pdfplumber как запасной вариант.
+
+    Ошибка pypdfium2 (при открытии или на любой странице) обрывает текст - неполный
+    разбор парсеры повторяют с use_pdfium=False.
+    """
+    if use_pdfium and pdfium is not None:
+        pdf = None
+        try:
+            pdf = pdfium.PdfDocument(pdf_path)
+            for page in pdf:
+                page_text = page.get_textpage().get_text_range()
+                if page_text.strip():
+                    yield page_text.replace('\r\n', '\n')
+        except pdfium.PdfiumError as e:
+            logger.warning("Ошибка pypdfium2 в %s (%s), текст будет прочитан через pdfplumber", pdf_path.name, e)
+        finally:
+            if pdf is not None:
+                pdf.close()
+        return
+
+    # pypdfium2 не установлен или отключен - используем pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                yield page_text
+
+def _read_order_text(pages: Iterator[str]) -> str:
+    """Текст заказа: страницы читаются, пока следующие могут что-то изменить"""
+    order_pages = _OrderPages()
+    for page_text in pages:
+        if order_pages.add(page_text):
+            break
+    return order_pages.text()
+
+def _scan_gutschrift(pages: Iterator[str]) -> Tuple[Dict, List[Tuple[str, ...]], bool]:
+    """Постраничный разбор гутшрифта: (совпадения шапки, группы детализации, есть ли текст)"""
+    # Шапку ищем постранично, пока поля не найдены (обычно первая страница),
+    # весь текст документа при этом не собирается
+    header = dict.fromkeys(_GUTSCHRIFT_HEADER)
+    # Детализация: завершенные блоки Transp.A. разбираем сразу,
+    # последний блок страницы может продолжиться на следующей
+    details = []
+    tail = None
+    has_text = False
+
+    for page_text in pages:
+        has_text = True
+        for pattern, match in header.items():
+            if match is None:
+                header[pattern] = pattern.search(page_text)
+
+        if tail is not None:
+            page_text = f"Transp.A.{tail}\n{page_text}"
+        chunks = _RE_DETAIL_SPLIT.split(page_text)
+        tail = chunks.pop() if len(chunks) > 1 else None
+        details.extend(_match_details(chunks[1:]))
+
+        # Итоги и вся детализация найдены - остальные страницы не нужны
+        if all(header.values()):
+            found = len(details) + (tail is not None and _RE_DETAIL.match(tail) is not None)
+            if found >= int(header[_RE_ORDER_COUNT].group(1)):
+                break
+
+    if tail is not None:
+        details.extend(_match_details([tail]))
+
+    return header, details, has_text
+
 # ═══════════════════════════════════════════════════════════════════
 #                      СТРУКТУРЫ ДАННЫХ
 # ═══════════════════════════════════════════════════════════════════
 
-@dataclass
+# __slots__ вместо __dict__ у экземпляров (доступно с Python 3.10)
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# Отображаемые названия городов (порядок важен для поиска по подстроке)
+_CITY_MAP = {
+    "GROSS-GERAU": "Groß-Gerau",
+    "ESCHWEILER": "Eschweiler",
+    "VOELKLINGEN": "Völklingen",
+    "VÖLKLINGEN": "Völklingen",
+    "SAARLOUIS": "Saarlouis",
+    "TROISDORF": "Troisdorf",
+    "LADENBURG": "Ladenburg",
+    "RASTATT": "Rastatt",
+    "BEXBACH": "Bexbach",
+    "WESEL": "Wesel",
+    "LANGENFELD": "Langenfeld",
+    "BOCHUM": "Bochum",
+    "HELMOND": "Helmond",
+    "ESSEN": "Essen",
+    "KLEINBLITTERSDORF": "Kleinblittersdorf",
+    "DORTMUND": "Dortmund",
+    "WUNSTORF": "Wunstorf",
+    "HEDDESHEIM": "Heddesheim",
+    "RAUNHEIM": "Raunheim",
+    "ROSBACH": "Rosbach",
+    "HAUNECK": "Hauneck",
+    "KÖLN": "Köln",
+    "KOLN": "Köln",
+    "LEVERKUSEN": "Leverkusen",
+}
+
+# Сокращения компаний, если город не найден
+_COMPANY_LABELS = (
+    ("NAGEL", "Na"),
+    ("EDEKA", "Edeka"),
+    ("BAKERMAN", "Bakerman"),
+    ("LACTALIS", "Lactalis"),
+)
+
+@functools.lru_cache(maxsize=4096)
+def _format_city_cached(address: str) -> str:
+    """Извлечение города из адреса"""
+    # Пытаемся найти город после индекса
+    if match := _RE_CITY.search(address):
+        city = match.group(1)
+        # Сокращаем длинные названия: сначала точное совпадение,
+        # затем поиск по подстроке (например, "DORTMUND-BRACKEL")
+        if name := _CITY_MAP.get(city):
+            return name
+        for key, name in _CITY_MAP.items():
+            if key in city:
+                return name
+        return city.title()
+
+    # Альтернативный метод - ищем Na, или другие компании
+    for key, label in _COMPANY_LABELS:
+        if key in address:
+            return label
+
+    return ""
+
+@dataclass(**_DATACLASS_OPTIONS)
 class TransportOrder:
     """Транспортный заказ с полной информацией"""
     # Основные поля
@@ -86,23 +409,13 @@ class TransportOrder:
     def format_tour(self) -> str:
         """Форматирование маршрута"""
         if self.loading_points or self.unloading_points:
-            # Форматируем как в эталонном CSV
-            loads = [self._format_city(p) for p in self.loading_points] if self.loading_points else []
-            unloads = [self._format_city(p) for p in self.unloading_points] if self.unloading_points else []
-
-            # Убираем дубликаты, сохраняя порядок
-            seen = set()
-            unique_loads = []
-            for l in loads:
-                if l and l not in seen:
-                    unique_loads.append(l)
-                    seen.add(l)
-
-            unique_unloads = []
-            for u in unloads:
-                if u and u not in seen:
-                    unique_unloads.append(u)
-                    seen.add(u)
+            # Форматируем как в эталонном CSV, убирая пустые значения
+            # и дубликаты с сохранением порядка
+            unique_loads = list(dict.fromkeys(filter(None, map(_format_city_cached, self.loading_points))))
+            unique_unloads = [
+                u for u in dict.fromkeys(filter(None, map(_format_city_cached, self.unloading_points)))
+                if u not in unique_loads
+            ]
 
             # Форматируем маршрут
             if unique_loads and unique_unloads:
@@ -120,70 +433,9 @@ class TransportOrder:
 
     def _format_city(self, address: str) -> str:
         """Извлечение города из адреса"""
-        # Пытаемся найти город после индекса
-        if match := re.search(r'D\s*\d{5}\s+([A-Z\-]+)', address):
-            city = match.group(1)
-            # Сокращаем длинные названия
-            if "GROSS-GERAU" in city:
-                return "Groß-Gerau"
-            elif "ESCHWEILER" in city:
-                return "Eschweiler"
-            elif "VOELKLINGEN" in city or "VÖLKLINGEN" in city:
-                return "Völklingen"
-            elif "SAARLOUIS" in city:
-                return "Saarlouis"
-            elif "TROISDORF" in city:
-                return "Troisdorf"
-            elif "LADENBURG" in city:
-                return "Ladenburg"
-            elif "RASTATT" in city:
-                return "Rastatt"
-            elif "BEXBACH" in city:
-                return "Bexbach"
-            elif "WESEL" in city:
-                return "Wesel"
-            elif "LANGENFELD" in city:
-                return "Langenfeld"
-            elif "BOCHUM" in city:
-                return "Bochum"
-            elif "HELMOND" in city:
-                return "Helmond"
-            elif "ESSEN" in city:
-                return "Essen"
-            elif "KLEINBLITTERSDORF" in city:
-                return "Kleinblittersdorf"
-            elif "DORTMUND" in city:
-                return "Dortmund"
-            elif "WUNSTORF" in city:
-                return "Wunstorf"
-            elif "HEDDESHEIM" in city:
-                return "Heddesheim"
-            elif "RAUNHEIM" in city:
-                return "Raunheim"
-            elif "ROSBACH" in city:
-                return "Rosbach"
-            elif "HAUNECK" in city:
-                return "Hauneck"
-            elif "KÖLN" in city or "KOLN" in city:
-                return "Köln"
-            elif "LEVERKUSEN" in city:
-                return "Leverkusen"
-            else:
-                return city.title()
-
-        # Альтернативный метод - ищем Na, или другие компании
-        if "NAGEL" in address:
-            return "Na"
-        elif "EDEKA" in address:
-            return "Edeka"
-        elif "BAKERMAN" in address:
-            return "Bakerman"
-        elif "LACTALIS" in address:
-            return "Lactalis"
+        return _format_city_cached(address)
 
-        return ""
-
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class GutschriftDetail:
     """Детализация заказа в гутшрифте"""
     transport_order: str  # Номер заказа
@@ -194,7 +446,7 @@ class GutschriftDetail:
     total: float
     route: str = ""
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class Gutschrift:
     """Гутшрифт с детализацией по заказам"""
     number: str
@@ -226,227 +478,322 @@ class FinalDocumentParser:
         """Конвертация немецкого числа в float"""
         try:
             # Удаляем точки (разделители тысяч) и заменяем запятую на точку
-            return float(text.replace('.', '').replace(',', '.'))
-        except:
+            if '.' in text:
+                return float(text.replace('.', '').replace(',', '.'))
+            return float(text.replace(',', '.'))
+        except ValueError:
             return 0.0
 
     def parse_transport_order(self, pdf_path: Path) -> Optional[TransportOrder]:
         """Парсинг транспортного заказа"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                # Извлекаем весь текст
-                full_text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        full_text += page_text + "\n"
-
-                if not full_text:
-                    logger.warning(f"Пустой PDF: {pdf_path.name}")
-                    return None
-
-                # Создаем объект заказа
-                order = TransportOrder(
-                    order_number="",
-                    date="",
-                    vehicle="",
-                    file_name=pdf_path.name
-                )
-
-                # Извлекаем номер заказа
-                if match := re.search(r'TRN-(\d{4}\s?\d{2})', full_text):
-                    order.order_number = match.group(1).replace(' ', '')
-                else:
-                    logger.warning(f"Не найден номер заказа в {pdf_path.name}")
-                    return None
-
-                # Извлекаем дату
-                if match := re.search(r'Datum:\s*(\d{2}\.\d{2}\.\d{4})', full_text):
-                    order.date = match.group(1)
-
-                # Извлекаем транспортное средство
-                if match := re.search(r'LKW-Kennzeichen:\s*([A-Z\s\-]+\d+)', full_text):
-                    order.vehicle = match.group(1).strip()
-
-                # Извлекаем километраж
-                if match := re.search(r'//(\d+)\s*LEERKM\s*//(\d+)\s*LAST\s*KM', full_text):
-                    order.empty_km = int(match.group(1))
-                    order.loaded_km = int(match.group(2))
-
-                # Извлекаем процент оплаты
-                if match := re.search(r'//\s*(\d+)%', full_text):
-                    order.payment_percent = int(match.group(1))
-
-                # Извлекаем финансовые данные
-                # Ищем строку с ценами
-                price_section = re.search(r'Frachtpreis:.*?Maut:.*?(\d+[,\.]\d+)\s*EUR\s+(\d+[,\.]\d+)\s*EUR', full_text, re.DOTALL)
-                if price_section:
-                    order.planned_freight = self.parse_german_number(price_section.group(1))
-                    order.planned_maut = self.parse_german_number(price_section.group(2))
-
-                # Извлекаем точки загрузки (Ladestellen)
-                loading_section = re.search(r'Ladestellen[^:]*:\s*(.*?)(?=\(Die vorgegebenen|Ladung:|$)', full_text, re.DOTALL)
-                if loading_section:
-                    text = loading_section.group(1).strip()
-                    # Разбиваем по строкам и ищем адреса
-                    lines = text.split('\n')
-                    current_address = []
-
-                    for line in lines:
-                        line = line.strip()
-                        if not line or 'Die vorgegebenen' in line:
-                            break
-                        # Ищем полный адрес (компания, улица, индекс и город)
-                        if re.search(r'[A-Z].*D\s*\d{5}', line):
-                            # Это строка с адресом и индексом
-                            # Извлекаем компанию, улицу, индекс и город
-                            match = re.search(r'([A-Z][\w\s\-&\.]+?),\s*([^,]+),\s*D\s*(\d{5})', line)
-                            if match:
-                                company = match.group(1).strip()
-                                street = match.group(2).strip()
-                                plz = match.group(3)
-
-                                # Ищем город после индекса (до следующих чисел или конца строки)
-                                rest_text = line[match.end():]
-                                city_match = re.search(r'^\s*([A-Z][A-Z\-]*)', rest_text)
-                                city = city_match.group(1) if city_match else ""
-
-                                full_address = f"{company}, {street}, D {plz} {city}".strip()
-                                order.loading_points.append(full_address)
-
-                # Извлекаем точки разгрузки (Empfänger)
-                empfanger_section = re.search(r'Empfänger[^:]*:\s*(.*?)(?=Frachtpreis|Zahlungsziel|$)', full_text, re.DOTALL)
-                if empfanger_section:
-                    text = empfanger_section.group(1).strip()
-                    # Разбиваем текст и ищем адреса
-                    lines = text.split('\n')
-
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        # Ищем полный адрес
-                        if re.search(r'[A-Z].*D\s*\d{5}', line):
-                            # Извлекаем компанию, улицу, индекс и город
-                            match = re.search(r'([A-Z][\w\s\-&\.]+?),\s*([^,]+),\s*D\s*(\d{5})', line)
-                            if match:
-                                company = match.group(1).strip()
-                                street = match.group(2).strip()
-                                plz = match.group(3)
-
-                                # Ищем город после индекса
-                                rest_text = line[match.end():]
-                                city_match = re.search(r'^\s*([A-Z][A-Z\-]*)', rest_text)
-                                city = city_match.group(1) if city_match else ""
-
-                                # Убираем "Buchungsnr.:" и другие служебные слова
-                                if 'Buchungsnr' not in company and 'zeiten' not in company:
-                                    full_address = f"{company}, {street}, D {plz} {city}".strip()
-                                    order.unloading_points.append(full_address)
-
-                # Альтернативный поиск - LEER IN для точки загрузки
-                if not order.loading_points:
-                    if match := re.search(r'LEER IN\s+([A-Z\-]+)', full_text):
-                        order.loading_points = [match.group(1)]
-
-                # Альтернативный поиск - Tourbeginn/Tourende в комментарии к километражу
-                if not order.loading_points or not order.unloading_points:
-                    # Ищем в инструкциях
-                    instruction = re.search(r'LADEINSTRUKTIONEN:.*?(?=A\.|$)', full_text, re.DOTALL)
-                    if instruction:
-                        instr_text = instruction.group(0)
-                        # Извлекаем города из инструкций
-                        if 'LEER IN' in instr_text:
-                            if match := re.search(r'LEER IN\s+([A-Z\-]+)', instr_text):
-                                if not order.loading_points:
-                                    order.loading_points = [match.group(1)]
-
-                logger.info(f"Обработан заказ {order.order_number} от {order.date} ({order.vehicle})")
-                return order
+            full_text = _read_order_text(_extract_pages(pdf_path))
+            order = self._order_from_text(full_text, pdf_path)
+            # Регулярные выражения подобраны под вывод pdfplumber (текст по положению на странице),
+            # pypdfium2 отдает текст в порядке потока содержимого: неполный разбор повторяем через pdfplumber
+            if pdfium is not None and not _is_order_parsed(full_text, order):
+                full_text = _read_order_text(_extract_pages(pdf_path, use_pdfium=False))
+                order = self._order_from_text(full_text, pdf_path)
+
+            if not full_text:
+                logger.warning("Пустой PDF: %s", pdf_path.name)
+                return None
+            if order is None:
+                logger.warning("Не найден номер заказа в %s", pdf_path.name)
+                return None
+
+            logger.info("Обработан заказ %s от %s (%s)", order.order_number, order.date, order.vehicle)
+            return order
 
         except Exception as e:
-            logger.error(f"Ошибка при парсинге {pdf_path.name}: {str(e)}")
+            logger.error("Ошибка при парсинге %s: %s", pdf_path.name, e)
             return None
 
+    def _order_from_text(self, full_text: str, pdf_path: Path) -> Optional[TransportOrder]:
+        """Разбор полей заказа из текста (None - не найден номер заказа)"""
+        # Создаем объект заказа
+        order = TransportOrder(
+            order_number="",
+            date="",
+            vehicle="",
+            file_name=pdf_path.name
+        )
+
+        # Извлекаем номер заказа
+        if match := _RE_ORDER_NUMBER.search(full_text):
+            order.order_number = match.group(1).replace(' ', '')
+        else:
+            return None
+
+        # Извлекаем дату
+        if match := _RE_DATE.search(full_text):
+            order.date = match.group(1)
+
+        # Извлекаем транспортное средство
+        if match := _RE_VEHICLE.search(full_text):
+            order.vehicle = match.group(1).strip()
+
+        # Извлекаем километраж
+        if match := _RE_KM.search(full_text):
+            order.empty_km = int(match.group(1))
+            order.loaded_km = int(match.group(2))
+
+        # Извлекаем процент оплаты
+        if match := _RE_PERCENT.search(full_text):
+            order.payment_percent = int(match.group(1))
+
+        # Извлекаем финансовые данные
+        # Ищем строку с ценами
+        price_section = _RE_PRICE.search(full_text)
+        if price_section:
+            order.planned_freight = self.parse_german_number(price_section.group(1))
+            order.planned_maut = self.parse_german_number(price_section.group(2))
+
+        # Извлекаем точки загрузки (Ladestellen)
+        order.loading_points = _parse_loading_points(full_text)
+
+        # Извлекаем точки разгрузки (Empfänger)
+        empfanger_section = _RE_UNLOAD.search(full_text)
+        if empfanger_section:
+            text = empfanger_section.group(1).strip()
+
+            # Ищем полные адреса по строкам
+            for match in _RE_ADDRESS.finditer(text):
+                company = match['company'].strip()
+                street = match['street'].strip()
+                city = match['city'] or ""
+
+                # Убираем "Buchungsnr.:" и другие служебные слова
+                if 'Buchungsnr' not in company and 'zeiten' not in company:
+                    full_address = f"{company}, {street}, D {match['plz']} {city}".strip()
+                    order.unloading_points.append(full_address)
+
+        # Альтернативный поиск - LEER IN для точки загрузки
+        if not order.loading_points:
+            if match := _RE_LEER_IN.search(full_text):
+                order.loading_points = [match.group(1)]
+
+        # Альтернативный поиск - Tourbeginn/Tourende в комментарии к километражу
+        if not order.loading_points or not order.unloading_points:
+            # Ищем в инструкциях
+            instruction = _RE_INSTRUCTION.search(full_text)
+            if instruction:
+                instr_text = instruction.group(0)
+                # Извлекаем города из инструкций
+                if 'LEER IN' in instr_text:
+                    if match := _RE_LEER_IN.search(instr_text):
+                        if not order.loading_points:
+                            order.loading_points = [match.group(1)]
+
+        return order
+
     def parse_gutschrift(self, pdf_path: Path) -> Optional[Gutschrift]:
         """Парсинг гутшрифта с детализацией"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                # Извлекаем весь текст
-                full_text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        full_text += page_text + "\n"
-
-                if not full_text:
-                    logger.warning(f"Пустой PDF: {pdf_path.name}")
-                    return None
-
-                # Создаем объект гутшрифта
-                gutschrift = Gutschrift(
-                    number="",
-                    date="",
-                    period_from="",
-                    period_to="",
-                    file_name=pdf_path.name
+            header, details, has_text = _scan_gutschrift(_extract_pages(pdf_path))
+            # Регулярные выражения подобраны под вывод pdfplumber (текст по положению на странице),
+            # pypdfium2 отдает текст в порядке потока содержимого: неполный разбор повторяем через pdfplumber
+            if pdfium is not None and not _is_gutschrift_parsed(header, details):
+                header, details, has_text = _scan_gutschrift(_extract_pages(pdf_path, use_pdfium=False))
+
+            if not has_text:
+                logger.warning("Пустой PDF: %s", pdf_path.name)
+                return None
+
+            # Создаем объект гутшрифта
+            gutschrift = Gutschrift(
+                number="",
+                date="",
+                period_from="",
+                period_to="",
+                file_name=pdf_path.name
+            )
+
+            # Извлекаем номер
+            if match := header[_RE_NUMBER]:
+                gutschrift.number = match.group(1)
+            else:
+                logger.warning("Не найден номер гутшрифта в %s", pdf_path.name)
+                return None
+
+            # Извлекаем дату
+            if match := header[_RE_DATE_GS]:
+                gutschrift.date = match.group(1)
+
+            # Извлекаем период
+            if match := header[_RE_PERIOD]:
+                gutschrift.period_from = match.group(1)
+                gutschrift.period_to = match.group(2)
+
+            # Извлекаем общие суммы с первой страницы
+            if match := header[_RE_TOTAL_FREIGHT]:
+                gutschrift.total_freight = self.parse_german_number(match.group(1))
+
+            if match := header[_RE_TOTAL_MAUT]:
+                gutschrift.total_maut = self.parse_german_number(match.group(1))
+
+            if match := header[_RE_GROSS]:
+                gutschrift.gross_amount = self.parse_german_number(match.group(1))
+
+            # Извлекаем количество заказов
+            if match := header[_RE_ORDER_COUNT]:
+                gutschrift.order_count = int(match.group(1))
+
+            # Детализация (обычно на второй странице)
+            for order_no, date, vehicle, freight, maut, total in details:
+                detail = GutschriftDetail(
+                    transport_order=order_no,
+                    date=date,
+                    vehicle=vehicle.strip(),
+                    freight=self.parse_german_number(freight),
+                    maut=self.parse_german_number(maut),
+                    total=self.parse_german_number(total)
                 )
+                gutschrift.details.append(detail)
+                logger.debug("  - Детализация: заказ %s, машина %s, сумма %s", detail.transport_order, detail.vehicle, detail.total)
 
-                # Извлекаем номер
-                if match := re.search(r'Nr\.:\s*(\d+)', full_text):
-                    gutschrift.number = match.group(1)
-                else:
-                    logger.warning(f"Не найден номер гутшрифта в {pdf_path.name}")
-                    return None
-
-                # Извлекаем дату
-                if match := re.search(r'vom:\s*(\d{2}\.\d{2}\.\d{4})', full_text):
-                    gutschrift.date = match.group(1)
-
-                # Извлекаем период
-                if match := re.search(r'Leistungszeitraum:\s*(\d{2}\.\d{2}\.\d{4})\s*-\s*(\d{2}\.\d{2}\.\d{4})', full_text):
-                    gutschrift.period_from = match.group(1)
-                    gutschrift.period_to = match.group(2)
-
-                # Извлекаем общие суммы с первой страницы
-                if match := re.search(r'Fracht\s+ST\s+[\d,\.]+\s+([\d,\.]+)', full_text):
-                    gutschrift.total_freight = self.parse_german_number(match.group(1))
-
-                if match := re.search(r'Mautkosten.*?ST\s+[\d,\.]+\s+([\d,\.]+)', full_text):
-                    gutschrift.total_maut = self.parse_german_number(match.group(1))
-
-                if match := re.search(r'Gesamtbetrag:\s*([\d,\.]+)\s*EUR', full_text):
-                    gutschrift.gross_amount = self.parse_german_number(match.group(1))
-
-                # Извлекаем количество заказов
-                if match := re.search(r'Anzahl.*?Transportaufträge.*?:\s*(\d+)', full_text):
-                    gutschrift.order_count = int(match.group(1))
-
-                # Парсим детализацию (обычно на второй странице)
-                # Ищем блоки с Transp.A.
-                detail_pattern = r'Transp\.A\.\s+.*?\n.*?\n(\d{6})\s+(\d{2}\.\d{2}\.\d{4}).*?([A-Z\s\-]+\d+).*?Fracht.*?D\s+[\d,]+\s+([\d,\.]+)\s+EUR.*?Mautkosten.*?D\s+[\d,]+\s+([\d,\.]+)\s+EUR.*?Summe\s+([\d,\.]+)\s+EUR'
-
-                for match in re.finditer(detail_pattern, full_text, re.DOTALL):
-                    detail = GutschriftDetail(
-                        transport_order=match.group(1),
-                        date=match.group(2),
-                        vehicle=match.group(3).strip(),
-                        freight=self.parse_german_number(match.group(4)),
-                        maut=self.parse_german_number(match.group(5)),
-                        total=self.parse_german_number(match.group(6))
-                    )
-                    gutschrift.details.append(detail)
-                    logger.debug(f"  - Детализация: заказ {detail.transport_order}, машина {detail.vehicle}, сумма {detail.total}")
-
-                logger.info(f"Обработан гутшрифт {gutschrift.number} от {gutschrift.date} с {len(gutschrift.details)} заказами")
-                return gutschrift
+            logger.info("Обработан гутшрифт %s от %s с %d заказами", gutschrift.number, gutschrift.date, len(gutschrift.details))
+            return gutschrift
 
         except Exception as e:
-            logger.error(f"Ошибка при парсинге {pdf_path.name}: {str(e)}")
+            logger.error("Ошибка при парсинге %s: %s", pdf_path.name, e)
             import traceback
             traceback.print_exc()
             return None
 
+# Функции верхнего уровня для пула процессов: в воркер передается только
+# ссылка на функцию, без сериализации экземпляра парсера
+def _parse_order_file(pdf_path: Path) -> Optional[TransportOrder]:
+    """Разбор одного транспортного заказа"""
+    return FinalDocumentParser().parse_transport_order(pdf_path)
+
+def _parse_gutschrift_file(pdf_path: Path) -> Optional[Gutschrift]:
+    """Разбор одного гутшрифта"""
+    return FinalDocumentParser().parse_gutschrift(pdf_path)
+
+# ═══════════════════════════════════════════════════════════════════
+#                      ЭКСПОРТ В EXCEL
+# ═══════════════════════════════════════════════════════════════════
+
+def _date_sort_key(date: str) -> Tuple[int, datetime]:
+    """Ключ сортировки по дате DD.MM.YYYY (некорректные даты - в конец)"""
+    try:
+        return (0, datetime.strptime(date, '%d.%m.%Y'))
+    except ValueError:
+        return (1, datetime.min)
+
+def _format_money(values: List[float], blank_zero: bool = False) -> List[str]:
+    """Форматирование сумм колонки в вид "123.45 €" (нули - пустая строка при blank_zero)"""
+    return [f"{value:.2f} €" if value or not blank_zero else "" for value in values]
+
+# Денежный формат Excel: суммы остаются числами, знак евро добавляет формат
+_MONEY_FORMAT = '#,##0.00" €"'
+
+def _write_sheet(workbook, sheet_name: str, df: pd.DataFrame,
+                 row_formats: Optional[Dict[int, list]] = None,
+                 widths: Optional[List[int]] = None,
+                 money_columns: Tuple[str, ...] = ()):
+    """Построчная запись DataFrame на новый лист книги xlsxwriter.
+
+    Строки пишутся строго по порядку, как требует режим constant_memory;
+    row_formats задает форматы ячеек отдельных строк DataFrame,
+    money_columns - колонки с суммами (числа с форматом "1,234.56 €").
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    # Соседние колонки одинаковой ширины задаем одним диапазоном (один <col> в XML)
+    first = 0
+    for width, group in groupby(widths or []):
+        last = first + len(list(group)) - 1
+        worksheet.set_column(first, last, width)
+        first = last + 1
+
+    if money_columns:
+        money_fmt = workbook.add_format({'num_format': _MONEY_FORMAT})
+        for name in money_columns:
+            col = df.columns.get_loc(name)
+            worksheet.set_column(col, col, 14, money_fmt)
+
+    # Заголовки в том же стиле, что и у pandas.to_excel
+    header_fmt = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    for col, name in enumerate(df.columns):
+        worksheet.write(0, col, name, header_fmt)
+
+    # NaN в xlsxwriter не записывается - пишем пустые ячейки, как pandas.to_excel
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+
+    # Строки без особых форматов пишем целиком через write_row,
+    # поячеечно - только строки из row_formats
+    row_formats = row_formats or {}
+    for row_idx, row in enumerate(rows):
+        if (formats := row_formats.get(row_idx)) is None:
+            worksheet.write_row(row_idx + 1, 0, row)
+            continue
+        for col, value in enumerate(row):
+            worksheet.write(row_idx + 1, col, value, formats[col])
+
+    return worksheet
+
+def _highlight_formats(workbook, df: pd.DataFrame) -> Tuple[Dict[int, list], List[int]]:
+    """Форматы проблемных ячеек и ширина колонок листа Hauptbericht"""
+    # Пастельно-красный цвет для проблемных ячеек
+    red_fmt = workbook.add_format({'bg_color': '#FFE6E6'})
+    # Пастельно-желтый для предупреждений
+    yellow_fmt = workbook.add_format({'bg_color': '#FFF9E6'})
+
+    # Маски проблемных строк считаем сразу для всего DataFrame
+    # 1. Заказ не сопоставлен с гутшрифтом (пустое поле GS_Datum)
+    unmatched = df['GS_Datum'].isna() | df['GS_Datum'].eq('')
+    # 2. Большая разница в километраже (>10%)
+    auftrag_km = pd.to_numeric(df['Auftrag_km'], errors='coerce')
+    gps_km = pd.to_numeric(df['GPS_km'], errors='coerce')
+    km_bad = (auftrag_km > 0) & ((gps_km - auftrag_km).abs() / auftrag_km > 0.1)
+    # 3. Процент оплаты меньше 100%
+    prozent = pd.to_numeric(df['Prozent'].astype(str).str.replace('%', '', regex=False), errors='coerce')
+    low_pct = prozent < 100
+    # 4. Отрицательная разница в цене больше 50 евро
+    diff_preis = pd.to_numeric(
+        df['Differenz_Preis'].astype(str)
+        .str.replace('€', '', regex=False)
+        .str.replace(',', '.', regex=False)
+        .str.strip(),
+        errors='coerce'
+    )
+    neg_price = diff_preis < -50
+
+    # Индексы колонок (с 0, как в xlsxwriter) считаем один раз
+    col_idx = {name: i for i, name in enumerate(df.columns)}
+    km_cols = [col_idx['Auftrag_km'], col_idx['GPS_km'], col_idx['Differenz_km']]
+
+    # Форматы проблемных ячеек собираем заранее: в режиме constant_memory
+    # строки пишутся один раз и по порядку. Правила применяются
+    # последовательно, более позднее перекрывает раннее
+    ncols = len(df.columns)
+    row_formats = {}
+    for row_idx in np.flatnonzero(unmatched.to_numpy()).tolist():
+        row_formats[row_idx] = [yellow_fmt] * ncols
+
+    # Выделяем колонки с километражом
+    for row_idx in np.flatnonzero(km_bad.to_numpy()).tolist():
+        formats = row_formats.setdefault(row_idx, [None] * ncols)
+        for col in km_cols:
+            formats[col] = red_fmt
+
+    # Выделяем колонку процента
+    for row_idx in np.flatnonzero(low_pct.to_numpy()).tolist():
+        row_formats.setdefault(row_idx, [None] * ncols)[col_idx['Prozent']] = yellow_fmt
+
+    for row_idx in np.flatnonzero(neg_price.to_numpy()).tolist():
+        row_formats.setdefault(row_idx, [None] * ncols)[col_idx['Differenz_Preis']] = red_fmt
+
+    # Автоматическая ширина колонок: максимум длин по столбцам DataFrame и заголовку
+    widths = np.maximum(
+        df.astype(str).apply(lambda column: column.str.len().max()).to_numpy(),
+        [len(str(name)) for name in df.columns]
+    ) + 2
+
+    return row_formats, [min(int(width), 50) for width in widths]
+
 # ═══════════════════════════════════════════════════════════════════
 #                    ПРОЦЕССОР ДОКУМЕНТОВ
 # ═══════════════════════════════════════════════════════════════════
@@ -491,23 +838,111 @@ class FinalDocumentProcessor:
 
         # Загрузка транспортных заказов
         if orders_path.exists():
-            for pdf_file in sorted(orders_path.glob("*.pdf")):
-                print(f"   Обработка: {pdf_file.name}")
-                order = self.parser.parse_transport_order(pdf_file)
-                if order:
-                    self.transport_orders.append(order)
+            orders_files = sorted(orders_path.glob("*.pdf"))
+            self.transport_orders.extend(self._parse_files(_parse_order_file, orders_files))
 
         # Загрузка гутшрифтов
         if gutschrifts_path.exists():
-            for pdf_file in sorted(gutschrifts_path.glob("*.pdf")):
-                print(f"   Обработка: {pdf_file.name}")
-                gutschrift = self.parser.parse_gutschrift(pdf_file)
-                if gutschrift:
-                    self.gutschrifts.append(gutschrift)
+            gutschrift_files = sorted(gutschrifts_path.glob("*.pdf"))
+            self.gutschrifts.extend(self._parse_files(_parse_gutschrift_file, gutschrift_files))
 
         print(f"✅ Загружено заказов: {len(self.transport_orders)}")
         print(f"✅ Загружено гутшрифтов: {len(self.gutschrifts)}")
 
+    def _cache_file(self, parse, pdf_path: Path) -> Path:
+        """Путь к кэшу разобранного PDF (ключ - SHA-256 содержимого файла)"""
+        digest = _file_digest(pdf_path)
+        return self.base_path / "logs" / "_cache" / f"v{_CACHE_VERSION}_{parse.__name__}_{digest}.pkl"
+
+    def _write_cache(self, cache_file: Path, doc) -> None:
+        """Атомарная запись в кэш: параллельные задачи не видят недописанный файл"""
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=cache_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(doc, f)
+            os.replace(tmp_name, cache_file)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def _prune_cache(self) -> None:
+        """Удаление записей кэша старше _CACHE_MAX_AGE и самых давних сверх _CACHE_MAX_BYTES"""
+        cache_dir = self.base_path / "logs" / "_cache"
+        if not cache_dir.exists():
+            return
+
+        now = time.time()
+        entries = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # Сначала самые свежие: они остаются, пока укладываются в объем
+        entries.sort(reverse=True)
+        total = 0
+        for mtime, size, path in entries:
+            total += size
+            if now - mtime > _CACHE_MAX_AGE or total > _CACHE_MAX_BYTES:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _parse_files(self, parse, files: List[Path]) -> list:
+        """Параллельный парсинг PDF по процессам с кэшем и сохранением порядка файлов"""
+        docs = [None] * len(files)
+        cache_files = [self._cache_file(parse, pdf_file) for pdf_file in files]
+
+        # Сначала берем уже разобранные документы из кэша
+        pending = []
+        for i, (pdf_file, cache_file) in enumerate(zip(files, cache_files)):
+            if cache_file.exists():
+                try:
+                    doc = pickle.loads(cache_file.read_bytes())
+                    # Отметка использования - давно не нужные записи удаляет _prune_cache
+                    os.utime(cache_file)
+                except FileNotFoundError:
+                    # Запись удалена очисткой кэша параллельной задачи
+                    pass
+                except (pickle.UnpicklingError, EOFError, AttributeError):
+                    logger.warning("Поврежден кэш для %s, парсим заново", pdf_file.name)
+                else:
+                    # Ключ кэша - только содержимое: имя файла берем из текущей загрузки
+                    doc.file_name = pdf_file.name
+                    docs[i] = doc
+                    print(f"   Из кэша: {pdf_file.name}")
+                    continue
+            print(f"   Обработка: {pdf_file.name}")
+            pending.append(i)
+
+        if not pending:
+            return [doc for doc in docs if doc]
+
+        # Запуск пула процессов окупается только на нескольких файлах
+        paths = [files[i] for i in pending]
+        if len(paths) < _PARALLEL_MIN_FILES:
+            parsed = list(map(parse, paths))
+        else:
+            # Не меньше 4 порций на воркер: все воркеры получают работу, а нагрузка выравнивается
+            workers = min(len(paths), os.cpu_count() or 1)
+            chunksize = max(1, len(paths) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as executor:
+                parsed = list(executor.map(parse, paths, chunksize=chunksize))
+
+        for i, doc in zip(pending, parsed):
+            docs[i] = doc
+            if doc:
+                self._write_cache(cache_files[i], doc)
+
+        self._prune_cache()
+        return [doc for doc in docs if doc]
+
     def match_documents(self):
         """Сопоставление документов по номерам заказов"""
         print("\n🔗 Сопоставление документов...")
@@ -515,20 +950,17 @@ class FinalDocumentProcessor:
         matched_count = 0
 
         # Создаем индекс детализации гутшрифтов
-        detail_index = {}
-        for gs in self.gutschrifts:
-            for detail in gs.details:
-                detail_index[detail.transport_order] = {
-                    'gutschrift': gs,
-                    'detail': detail
-                }
+        detail_index = {
+            detail.transport_order: (gs, detail)
+            for gs in self.gutschrifts
+            for detail in gs.details
+        }
 
         # Сопоставляем каждый заказ
         for order in self.transport_orders:
-            if order.order_number in detail_index:
-                info = detail_index[order.order_number]
-                gutschrift = info['gutschrift']
-                detail = info['detail']
+            pair = detail_index.get(order.order_number)
+            if pair is not None:
+                gutschrift, detail = pair
 
                 # Заполняем данные из гутшрифта
                 order.gutschrift_number = gutschrift.number
@@ -543,9 +975,9 @@ class FinalDocumentProcessor:
                     order.gutschrift_amount = detail.total
 
                 matched_count += 1
-                logger.info(f"✅ Сопоставлен заказ {order.order_number} с гутшрифтом {gutschrift.number}")
+                logger.info("✅ Сопоставлен заказ %s с гутшрифтом %s", order.order_number, gutschrift.number)
             else:
-                logger.warning(f"⚠️ Не найден гутшрифт для заказа {order.order_number}")
+                logger.warning("⚠️ Не найден гутшрифт для заказа %s", order.order_number)
 
         print(f"✅ Сопоставлено: {matched_count} из {len(self.transport_orders)} заказов")
 
@@ -553,300 +985,148 @@ class FinalDocumentProcessor:
         """Генерация отчета в формате эталонного CSV"""
         print("\n📊 Генерация отчета...")
 
-        # Подготовка данных для DataFrame
-        data = []
-        for order in self.transport_orders:
-            # Форматируем маршрут
-            tour = order.format_tour()
-
-            # Расчет разницы
-            price_difference = order.gutschrift_amount - order.planned_total if order.gutschrift_amount else 0
-            km_difference = order.gps_km - order.total_km
-
-            row = {
-                'Datum': order.date,
-                'Tournummer': order.order_number,
-                'Tour': tour,
-                'Ladestellen': ' | '.join(order.loading_points) if order.loading_points else "",
-                'Entladestellen': ' | '.join(order.unloading_points) if order.unloading_points else "",
-                'Auftrag_km': order.total_km,
-                'GPS_km': order.gps_km,
-                'Maut_Auftrag': f"{order.planned_maut:.2f} €",
-                'Maut_Gefahren': f"{order.gutschrift_maut:.2f} €" if order.gutschrift_maut else "",
-                'Preis_Plan': f"{order.planned_freight:.2f} €",
-                'Preis_Tatsächlich': f"{order.planned_total:.2f} €",
-                'Gutschrift': f"{order.gutschrift_amount:.2f} €" if order.gutschrift_amount else "",
-                'Kosten_Auftrag': f"{order.planned_total:.2f} €",
-                'Kosten_Gefahren': f"{order.gutschrift_amount:.2f} €" if order.gutschrift_amount else "",
-                'Differenz_km': km_difference,
-                'Differenz_Preis': f"{price_difference:.2f} €" if price_difference else "",
-                'Bearbeiter': 'EV',
-                'GS_Datum': f"{order.gutschrift_number}/{order.gutschrift_date}" if order.gutschrift_number else "",
-                'LKW': order.vehicle,
-                'Prozent': f"{order.payment_percent}%"
-            }
-            data.append(row)
-
-        # Создание DataFrame
-        df = pd.DataFrame(data)
-
-        # Сортировка по дате только если есть данные
-        if not df.empty and 'Datum' in df.columns:
-            df['Datum_sort'] = pd.to_datetime(df['Datum'], format='%d.%m.%Y', errors='coerce')
-            df = df.sort_values('Datum_sort')
-            df = df.drop('Datum_sort', axis=1)
+        # Сортировка по дате (некорректные даты - в конец)
+        orders = sorted(self.transport_orders, key=lambda o: _date_sort_key(o.date))
+
+        # Подготовка данных для DataFrame по колонкам
+        planned_totals = [o.planned_total for o in orders]
+        gutschrift_amounts = [o.gutschrift_amount for o in orders]
+        price_differences = [o.gutschrift_amount - o.planned_total if o.gutschrift_amount else 0 for o in orders]
+
+        columns = {
+            'Datum': [o.date for o in orders],
+            'Tournummer': [o.order_number for o in orders],
+            'Tour': [o.format_tour() for o in orders],
+            'Ladestellen': [' | '.join(o.loading_points) for o in orders],
+            'Entladestellen': [' | '.join(o.unloading_points) for o in orders],
+            'Auftrag_km': [o.total_km for o in orders],
+            'GPS_km': [o.gps_km for o in orders],
+            'Maut_Auftrag': _format_money([o.planned_maut for o in orders]),
+            'Maut_Gefahren': _format_money([o.gutschrift_maut for o in orders], blank_zero=True),
+            'Preis_Plan': _format_money([o.planned_freight for o in orders]),
+            'Preis_Tatsächlich': _format_money(planned_totals),
+            'Gutschrift': _format_money(gutschrift_amounts, blank_zero=True),
+            'Kosten_Auftrag': _format_money(planned_totals),
+            'Kosten_Gefahren': _format_money(gutschrift_amounts, blank_zero=True),
+            'Differenz_km': [o.gps_km - o.total_km for o in orders],
+            'Differenz_Preis': _format_money(price_differences, blank_zero=True),
+            'Bearbeiter': ['EV'] * len(orders),
+            'GS_Datum': [f"{o.gutschrift_number}/{o.gutschrift_date}" if o.gutschrift_number else "" for o in orders],
+            'LKW': [o.vehicle for o in orders],
+            'Prozent': [f"{o.payment_percent}%" for o in orders]
+        }
 
         # Добавление итогов только если есть данные
-        if self.transport_orders:
+        if orders:
+            # Один проход по заказам вместо отдельной суммы на каждую колонку
+            total_km = gps_km = km_diff = 0
+            planned_maut = planned_freight = planned_total = 0.0
+            gutschrift_maut = gutschrift_amount = price_diff = 0.0
+            for o in orders:
+                total_km += o.total_km
+                gps_km += o.gps_km
+                km_diff += o.gps_km - o.total_km
+                planned_maut += o.planned_maut
+                planned_freight += o.planned_freight
+                planned_total += o.planned_total
+                gutschrift_maut += o.gutschrift_maut
+                gutschrift_amount += o.gutschrift_amount
+                if o.gutschrift_amount:
+                    price_diff += o.gutschrift_amount - o.planned_total
+
             total_row = {
                 'Datum': 'GESAMT',
                 'Tournummer': '',
                 'Tour': '',
                 'Ladestellen': '',
                 'Entladestellen': '',
-                'Auftrag_km': sum(o.total_km for o in self.transport_orders),
-                'GPS_km': sum(o.gps_km for o in self.transport_orders),
-                'Maut_Auftrag': f"{sum(o.planned_maut for o in self.transport_orders):.2f} €",
-                'Maut_Gefahren': f"{sum(o.gutschrift_maut for o in self.transport_orders):.2f} €",
-                'Preis_Plan': f"{sum(o.planned_freight for o in self.transport_orders):.2f} €",
-                'Preis_Tatsächlich': f"{sum(o.planned_total for o in self.transport_orders):.2f} €",
-                'Gutschrift': f"{sum(o.gutschrift_amount for o in self.transport_orders):.2f} €",
-                'Kosten_Auftrag': f"{sum(o.planned_total for o in self.transport_orders):.2f} €",
-                'Kosten_Gefahren': f"{sum(o.gutschrift_amount for o in self.transport_orders):.2f} €",
-                'Differenz_km': sum(o.gps_km - o.total_km for o in self.transport_orders),
-                'Differenz_Preis': f"{sum(o.gutschrift_amount - o.planned_total for o in self.transport_orders if o.gutschrift_amount):.2f} €",
+                'Auftrag_km': total_km,
+                'GPS_km': gps_km,
+                'Maut_Auftrag': f"{planned_maut:.2f} €",
+                'Maut_Gefahren': f"{gutschrift_maut:.2f} €",
+                'Preis_Plan': f"{planned_freight:.2f} €",
+                'Preis_Tatsächlich': f"{planned_total:.2f} €",
+                'Gutschrift': f"{gutschrift_amount:.2f} €",
+                'Kosten_Auftrag': f"{planned_total:.2f} €",
+                'Kosten_Gefahren': f"{gutschrift_amount:.2f} €",
+                'Differenz_km': km_diff,
+                'Differenz_Preis': f"{price_diff:.2f} €",
                 'Bearbeiter': '',
                 'GS_Datum': '',
                 'LKW': '',
                 'Prozent': ''
             }
+            for name, value in total_row.items():
+                columns[name].append(value)
 
-            df = pd.concat([df, pd.DataFrame([total_row])], ignore_index=True)
+        # Создание DataFrame одним вызовом, без pd.concat для строки итогов
+        df = pd.DataFrame(columns)
 
         return df
 
-    def export_to_excel_custom(self, df: pd.DataFrame, output_file: str, stats: dict = None) -> str:
-        """Экспорт в Excel с форматированием для веб-интерфейса"""
-        from openpyxl.styles import PatternFill, Alignment, Font
-
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            # Основной отчет
-            if df is not None and not df.empty:
-                df.to_excel(writer, sheet_name='Hauptbericht', index=False)
-
-                # Получаем лист для форматирования
-                workbook = writer.book
-                worksheet = writer.sheets['Hauptbericht']
-
-                # Пастельно-красный цвет для проблемных ячеек
-                red_fill = PatternFill(start_color='FFE6E6', end_color='FFE6E6', fill_type='solid')
-                # Пастельно-желтый для предупреждений
-                yellow_fill = PatternFill(start_color='FFF9E6', end_color='FFF9E6', fill_type='solid')
-
-                # Проходим по строкам данных (начиная со 2-й строки, т.к. 1-я - заголовки)
-                for row_num in range(2, len(df) + 2):
-                    # Получаем индекс строки в DataFrame
-                    df_row_idx = row_num - 2
-
-                    if df_row_idx < len(df):
-                        row_data = df.iloc[df_row_idx]
-
-                        # Проверяем проблемные условия:
-
-                        # 1. Если заказ не сопоставлен с гутшрифтом (пустое поле GS_Datum)
-                        if pd.isna(row_data.get('GS_Datum')) or row_data.get('GS_Datum') == '':
-                            for col in range(1, worksheet.max_column + 1):
-                                worksheet.cell(row=row_num, column=col).fill = yellow_fill
-
-                        # 2. Если есть большая разница в километраже (>10%)
-                        try:
-                            if 'Auftrag_km' in row_data and 'GPS_km' in row_data:
-                                auftrag_km = row_data['Auftrag_km']
-                                gps_km = row_data['GPS_km']
-                                if isinstance(auftrag_km, (int, float)) and isinstance(gps_km, (int, float)):
-                                    if auftrag_km > 0 and abs(gps_km - auftrag_km) / auftrag_km > 0.1:
-                                        # Выделяем колонки с километражом
-                                        for col_name in ['Auftrag_km', 'GPS_km', 'Differenz_km']:
-                                            if col_name in df.columns:
-                                                col_idx = df.columns.get_loc(col_name) + 1
-                                                worksheet.cell(row=row_num, column=col_idx).fill = red_fill
-                        except:
-                            pass
-
-                        # 3. Если процент оплаты меньше 100%
-                        try:
-                            if 'Prozent' in row_data:
-                                prozent_str = str(row_data['Prozent']).replace('%', '')
-                                if prozent_str and prozent_str.replace('.', '').isdigit():
-                                    prozent_val = float(prozent_str)
-                                    if prozent_val < 100:
-                                        # Выделяем колонку процента
-                                        col_idx = df.columns.get_loc('Prozent') + 1
-                                        worksheet.cell(row=row_num, column=col_idx).fill = yellow_fill
-                        except:
-                            pass
-
-                        # 4. Если есть отрицательная разница в цене
-                        try:
-                            if 'Differenz_Preis' in row_data:
-                                diff_preis = str(row_data['Differenz_Preis']).replace('€', '').replace(',', '.').strip()
-                                if diff_preis and diff_preis.replace('.', '').replace('-', '').isdigit():
-                                    if float(diff_preis) < -50:  # Если разница больше -50 евро
-                                        col_idx = df.columns.get_loc('Differenz_Preis') + 1
-                                        worksheet.cell(row=row_num, column=col_idx).fill = red_fill
-                        except:
-                            pass
-
-                # Автоматическая ширина колонок
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
-
-            # Лист Gutschriften - сводка по гутшрифтам
-            gs_data = []
-            for gs in self.gutschrifts:
-                gs_data.append({
-                    'Nummer': gs.number,
-                    'Datum': gs.date,
-                    'Periode': f"{gs.period_from} - {gs.period_to}",
-                    'Fracht': f"{gs.total_freight:.2f} €",
-                    'Maut': f"{gs.total_maut:.2f} €",
-                    'Gesamt': f"{gs.gross_amount:.2f} €",
-                    'Anzahl_Aufträge': gs.order_count,
-                    'Details': len(gs.details)
-                })
-
-            if gs_data:
-                gs_df = pd.DataFrame(gs_data)
-                gs_df.to_excel(writer, sheet_name='Gutschriften', index=False)
-
-            # Лист GS_Details - детализация гутшрифтов
-            detail_data = []
-            for gs in self.gutschrifts:
-                for detail in gs.details:
-                    detail_data.append({
-                        'GS_Nummer': gs.number,
-                        'Transport_Auftrag': detail.transport_order,
-                        'Datum': detail.date,
-                        'LKW': detail.vehicle,
-                        'Fracht': f"{detail.freight:.2f} €",
-                        'Maut': f"{detail.maut:.2f} €",
-                        'Summe': f"{detail.total:.2f} €"
-                    })
-
-            if detail_data:
-                detail_df = pd.DataFrame(detail_data)
-                detail_df.to_excel(writer, sheet_name='GS_Details', index=False)
-
-            # Лист Statistik - статистика
-            if stats:
-                matched_orders = [o for o in self.transport_orders if o.gutschrift_number]
-                unmatched_orders = [o for o in self.transport_orders if not o.gutschrift_number]
-
-                stats_data = {
-                    'Метрика': [
-                        'Всего заказов',
-                        'Всего гутшрифтов',
-                        'Сопоставлено заказов',
-                        'Не сопоставлено',
-                        'Общий километраж (план)',
-                        'Общий километраж (факт)',
-                        'Общий фрахт (план)',
-                        'Общий маут (план)',
-                        'Итоговая сумма (план)',
-                        'Итоговая сумма (гутшрифт)',
-                        'Общая разница'
-                    ],
-                    'Значение': [
-                        len(self.transport_orders),
-                        len(self.gutschrifts),
-                        len(matched_orders),
-                        len(unmatched_orders),
-                        sum(o.total_km for o in self.transport_orders) if self.transport_orders else 0,
-                        sum(o.gps_km for o in self.transport_orders) if self.transport_orders else 0,
-                        f"{sum(o.planned_freight for o in self.transport_orders):.2f} €" if self.transport_orders else "0.00 €",
-                        f"{sum(o.planned_maut for o in self.transport_orders):.2f} €" if self.transport_orders else "0.00 €",
-                        f"{sum(o.planned_total for o in self.transport_orders):.2f} €" if self.transport_orders else "0.00 €",
-                        f"{sum(o.gutschrift_amount for o in matched_orders):.2f} €" if matched_orders else "0.00 €",
-                        f"{sum(o.gutschrift_amount - o.planned_total for o in matched_orders):.2f} €" if matched_orders else "0.00 €"
-                    ]
-                }
-                stats_df = pd.DataFrame(stats_data)
-                stats_df.to_excel(writer, sheet_name='Statistik', index=False)
-
-            # Лист Nicht_zugeordnet - несопоставленные заказы
-            unmatched_orders = [o for o in self.transport_orders if not o.gutschrift_number]
-            if unmatched_orders:
-                unmatched_data = []
-                for order in unmatched_orders:
-                    unmatched_data.append({
-                        'Tournummer': order.order_number,
-                        'Datum': order.date,
-                        'LKW': order.vehicle,
-                        'Tour': order.format_tour(),
-                        'Summe': f"{order.planned_total:.2f} €"
-                    })
-                unmatched_df = pd.DataFrame(unmatched_data)
-                unmatched_df.to_excel(writer, sheet_name='Nicht_zugeordnet', index=False)
-
-        return output_file
-
-    def export_to_excel(self, df: pd.DataFrame) -> str:
-        """Экспорт в Excel с форматированием"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = self.base_path / "output" / f"transtar_final_{timestamp}.xlsx"
+    def _partition_orders(self) -> Tuple[List[TransportOrder], List[TransportOrder]]:
+        """Разделение заказов на сопоставленные и несопоставленные за один проход"""
+        matched, unmatched = [], []
+        for order in self.transport_orders:
+            (matched if order.gutschrift_number else unmatched).append(order)
+        return matched, unmatched
+
+    def _write_workbook(self, workbook, df: pd.DataFrame, include_stats: bool = True, highlight: bool = False):
+        """Запись всех листов отчета в открытую книгу xlsxwriter"""
+        matched_orders, unmatched_orders = self._partition_orders()
+
+        # Основной отчет (с подсветкой проблемных ячеек - только если в нем есть строки)
+        if not highlight:
+            _write_sheet(workbook, 'Hauptbericht', df)
+        elif df is not None and not df.empty:
+            row_formats, widths = _highlight_formats(workbook, df)
+            _write_sheet(workbook, 'Hauptbericht', df, row_formats=row_formats, widths=widths)
+
+        # Лист Gutschriften - сводка по гутшрифтам
+        if self.gutschrifts:
+            gutschrifts = self.gutschrifts
+            gs_df = pd.DataFrame({
+                'Nummer': [gs.number for gs in gutschrifts],
+                'Datum': [gs.date for gs in gutschrifts],
+                'Periode': [f"{gs.period_from} - {gs.period_to}" for gs in gutschrifts],
+                'Fracht': [gs.total_freight for gs in gutschrifts],
+                'Maut': [gs.total_maut for gs in gutschrifts],
+                'Gesamt': [gs.gross_amount for gs in gutschrifts],
+                'Anzahl_Aufträge': [gs.order_count for gs in gutschrifts],
+                'Details': [len(gs.details) for gs in gutschrifts]
+            })
+            _write_sheet(workbook, 'Gutschriften', gs_df, money_columns=('Fracht', 'Maut', 'Gesamt'))
+
+        # Лист GS_Details - детализация гутшрифтов
+        detail_rows = [
+            (gs.number, d.transport_order, d.date, d.vehicle, d.freight, d.maut, d.total)
+            for gs in self.gutschrifts
+            for d in gs.details
+        ]
 
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            # Основной отчет
-            df.to_excel(writer, sheet_name='Hauptbericht', index=False)
-
-            # Детали гутшрифтов
-            gs_data = []
-            for gs in self.gutschrifts:
-                gs_data.append({
-                    'Nummer': gs.number,
-                    'Datum': gs.date,
-                    'Periode': f"{gs.period_from} - {gs.period_to}",
-                    'Fracht': f"{gs.total_freight:.2f} €",
-                    'Maut': f"{gs.total_maut:.2f} €",
-                    'Gesamt': f"{gs.gross_amount:.2f} €",
-                    'Anzahl_Aufträge': gs.order_count,
-                    'Details': len(gs.details)
-                })
-
-            if gs_data:
-                gs_df = pd.DataFrame(gs_data)
-                gs_df.to_excel(writer, sheet_name='Gutschriften', index=False)
-
-            # Детализация гутшрифтов
-            detail_data = []
-            for gs in self.gutschrifts:
-                for detail in gs.details:
-                    detail_data.append({
-                        'GS_Nummer': gs.number,
-                        'Transport_Auftrag': detail.transport_order,
-                        'Datum': detail.date,
-                        'LKW': detail.vehicle,
-                        'Fracht': f"{detail.freight:.2f} €",
-                        'Maut': f"{detail.maut:.2f} €",
-                        'Summe': f"{detail.total:.2f} €"
-                    })
-
-            if detail_data:
-                detail_df = pd.DataFrame(detail_data)
-                detail_df.to_excel(writer, sheet_name='GS_Details', index=False)
-
-            # Статистика
-            matched_orders = [o for o in self.transport_orders if o.gutschrift_number]
-            unmatched_orders = [o for o in self.transport_orders if not o.gutschrift_number]
+        if detail_rows:
+            detail_df = pd.DataFrame(
+                detail_rows,
+                columns=['GS_Nummer', 'Transport_Auftrag', 'Datum', 'LKW', 'Fracht', 'Maut', 'Summe']
+            )
+            _write_sheet(workbook, 'GS_Details', detail_df, money_columns=('Fracht', 'Maut', 'Summe'))
+
+        # Лист Statistik - статистика
+        if include_stats:
+            # Суммы для статистики за один проход по заказам
+            total_km = gps_km = 0
+            planned_freight = planned_maut = planned_total = 0.0
+            for o in self.transport_orders:
+                total_km += o.total_km
+                gps_km += o.gps_km
+                planned_freight += o.planned_freight
+                planned_maut += o.planned_maut
+                planned_total += o.planned_total
+
+            gutschrift_amount = price_diff = 0.0
+            for o in matched_orders:
+                gutschrift_amount += o.gutschrift_amount
+                price_diff += o.gutschrift_amount - o.planned_total
 
             stats_data = {
                 'Метрика': [
@@ -867,31 +1147,43 @@ class FinalDocumentProcessor:
                     len(self.gutschrifts),
                     len(matched_orders),
                     len(unmatched_orders),
-                    sum(o.total_km for o in self.transport_orders),
-                    sum(o.gps_km for o in self.transport_orders),
-                    f"{sum(o.planned_freight for o in self.transport_orders):.2f} €",
-                    f"{sum(o.planned_maut for o in self.transport_orders):.2f} €",
-                    f"{sum(o.planned_total for o in self.transport_orders):.2f} €",
-                    f"{sum(o.gutschrift_amount for o in matched_orders):.2f} €",
-                    f"{sum(o.gutschrift_amount - o.planned_total for o in matched_orders):.2f} €"
+                    total_km,
+                    gps_km,
+                    f"{planned_freight:.2f} €",
+                    f"{planned_maut:.2f} €",
+                    f"{planned_total:.2f} €",
+                    f"{gutschrift_amount:.2f} €",
+                    f"{price_diff:.2f} €"
                 ]
             }
             stats_df = pd.DataFrame(stats_data)
-            stats_df.to_excel(writer, sheet_name='Statistik', index=False)
-
-            # Несопоставленные заказы
-            if unmatched_orders:
-                unmatched_data = []
-                for order in unmatched_orders:
-                    unmatched_data.append({
-                        'Tournummer': order.order_number,
-                        'Datum': order.date,
-                        'LKW': order.vehicle,
-                        'Tour': order.format_tour(),
-                        'Summe': f"{order.planned_total:.2f} €"
-                    })
-                unmatched_df = pd.DataFrame(unmatched_data)
-                unmatched_df.to_excel(writer, sheet_name='Nicht_zugeordnet', index=False)
+            _write_sheet(workbook, 'Statistik', stats_df)
+
+        # Лист Nicht_zugeordnet - несопоставленные заказы
+        if unmatched_orders:
+            unmatched_df = pd.DataFrame({
+                'Tournummer': [o.order_number for o in unmatched_orders],
+                'Datum': [o.date for o in unmatched_orders],
+                'LKW': [o.vehicle for o in unmatched_orders],
+                'Tour': [o.format_tour() for o in unmatched_orders],
+                'Summe': [o.planned_total for o in unmatched_orders]
+            })
+            _write_sheet(workbook, 'Nicht_zugeordnet', unmatched_df, money_columns=('Summe',))
+
+    def export_to_excel_custom(self, df: pd.DataFrame, output_file: str, stats: dict = None) -> str:
+        """Экспорт в Excel с форматированием для веб-интерфейса"""
+        with xlsxwriter.Workbook(str(output_file), {'constant_memory': True}) as workbook:
+            self._write_workbook(workbook, df, include_stats=bool(stats), highlight=True)
+
+        return output_file
+
+    def export_to_excel(self, df: pd.DataFrame) -> str:
+        """Экспорт в Excel с форматированием"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_file = self.base_path / "output" / f"transtar_final_{timestamp}.xlsx"
+
+        with xlsxwriter.Workbook(str(output_file), {'constant_memory': True}) as workbook:
+            self._write_workbook(workbook, df)
 
         print(f"✅ Отчет сохранен: {output_file}")
         return str(output_file)
@@ -955,7 +1247,7 @@ def main():
         return processor, df
 
     except Exception as e:
-        logger.error(f"Критическая ошибка: {str(e)}")
+        logger.error("Критическая ошибка: %s", e)
         import traceback
         traceback.print_exc()
         return None
@@ -7,12 +7,18 @@ Flask веб-приложение для обработки транспортн
 import os
 import sys
 import json
+import time
+import functools
+import logging
 import shutil
 import tempfile
+import threading
+import uuid
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file
-from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, send_from_directory
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
 import pandas as pd
 
@@ -22,25 +28,69 @@ sys.path.insert(0, parent_dir)
 
 from transtar_nagel_final import FinalDocumentProcessor
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
-CORS(app)
+
+# Интерфейс отдается самим Flask (same-origin), CORS нужен только для внешних клиентов:
+# CORS_ORIGINS="https://a.example.com,https://b.example.com"; preflight кэшируется браузером сутки
+if cors_origins := os.environ.get('CORS_ORIGINS'):
+    from flask_cors import CORS
+    CORS(app, origins=[origin.strip() for origin in cors_origins.split(',')], max_age=86400)
 
 # Конфигурация
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB макс размер
 app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
-ALLOWED_EXTENSIONS = {'pdf'}
-
-# Глобальная переменная для хранения прогресса
-processing_status = {
-    'status': 'idle',
-    'progress': 0,
-    'message': '',
-    'details': {}
-}
+ALLOWED_EXTENSIONS = ('.pdf',)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MB буфер копирования загрузок
+HISTORY_TTL = 2  # секунды кэширования списка отчетов
+
+# Статусы задач обработки по job_id; доступ только под блокировкой
+MAX_JOBS = 100  # сколько последних задач хранить в памяти
+jobs = {}
+jobs_lock = threading.Lock()
+
+# Фоновая обработка: /upload отвечает сразу, не дожидаясь отчета. Задачи выполняются
+# по одной: PDFium не потокобезопасен (даже для разных документов), а параллельность
+# по файлам дает пул процессов внутри load_documents
+executor = ThreadPoolExecutor(max_workers=1)
+
+def set_job_status(job_id, **status):
+    """Полная замена статуса задачи (старые завершенные задачи сверх MAX_JOBS удаляются)"""
+    with jobs_lock:
+        jobs.pop(job_id, None)
+        jobs[job_id] = status
+        if (excess := len(jobs) - MAX_JOBS) > 0:
+            # Задачи в очереди и в работе не удаляем - их статус еще обновляется и опрашивается
+            finished = [jid for jid, job in jobs.items() if job['status'] in ('completed', 'error')]
+            for jid in finished[:excess]:
+                del jobs[jid]
+
+def update_job_status(job_id, details=None, **fields):
+    """Обновление полей статуса задачи; details дополняются, а не заменяются"""
+    with jobs_lock:
+        if (status := jobs.get(job_id)) is None:
+            return
+        status.update(fields)
+        if details:
+            status['details'] = {**status['details'], **details}
+
+def get_job_status(job_id):
+    """Снимок статуса задачи (None - задача неизвестна)"""
+    with jobs_lock:
+        status = jobs.get(job_id)
+        # details при обновлении заменяются целиком, поверхностной копии достаточно
+        return dict(status) if status is not None else None
 
 def allowed_file(filename):
     """Проверка допустимых расширений файлов"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_EXTENSIONS)
+
+def save_upload(file, directory):
+    """Потоковое сохранение загруженного файла блоками по 1 MB"""
+    filename = secure_filename(file.filename)
+    with open(os.path.join(directory, filename), 'wb', buffering=0) as out:
+        shutil.copyfileobj(file.stream, out, length=UPLOAD_CHUNK_SIZE)
 
 @app.route('/')
 def index():
@@ -49,77 +99,84 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    """Загрузка и обработка файлов"""
-    global processing_status
-
+    """Загрузка файлов и постановка обработки в фоновую очередь"""
+    # Проверка наличия файлов
+    if 'orders' not in request.files and 'gutschrifts' not in request.files:
+        return jsonify({'error': 'Не загружены файлы'}), 400
+
+    # Создание временных папок
+    temp_dir = tempfile.mkdtemp()
+    orders_dir = os.path.join(temp_dir, 'orders')
+    gutschrifts_dir = os.path.join(temp_dir, 'gutschrifts')
+    os.makedirs(orders_dir, exist_ok=True)
+    os.makedirs(gutschrifts_dir, exist_ok=True)
+
+    # Файлы сохраняем в рамках запроса - после ответа поток загрузки закрывается
     try:
-        # Проверка наличия файлов
-        if 'orders' not in request.files and 'gutschrifts' not in request.files:
-            return jsonify({'error': 'Не загружены файлы'}), 400
-
-        # Создание временных папок
-        temp_dir = tempfile.mkdtemp()
-        orders_dir = os.path.join(temp_dir, 'orders')
-        gutschrifts_dir = os.path.join(temp_dir, 'gutschrifts')
-        os.makedirs(orders_dir, exist_ok=True)
-        os.makedirs(gutschrifts_dir, exist_ok=True)
-
         # Сохранение транспортных заказов
         order_files = request.files.getlist('orders')
         for file in order_files:
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(orders_dir, filename))
+                save_upload(file, orders_dir)
 
         # Сохранение гутшрифтов
         gutschrift_files = request.files.getlist('gutschrifts')
         for file in gutschrift_files:
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(gutschrifts_dir, filename))
-
-        # Установка начального статуса
-        processing_status = {
-            'status': 'processing',
-            'progress': 10,
-            'message': 'Начинаю обработку документов...',
-            'details': {
-                'orders_count': len(order_files),
-                'gutschrifts_count': len(gutschrift_files)
-            }
+                save_upload(file, gutschrifts_dir)
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 500
+
+    # Установка начального статуса
+    job_id = uuid.uuid4().hex
+    set_job_status(
+        job_id,
+        status='processing',
+        progress=10,
+        message='Начинаю обработку документов...',
+        details={
+            'orders_count': len(order_files),
+            'gutschrifts_count': len(gutschrift_files)
         }
+    )
+
+    logger.debug("Задача %s: orders=%d gutschrifts=%d (%s)",
+                 job_id, len(order_files), len(gutschrift_files), temp_dir)
+
+    executor.submit(process_job, job_id, temp_dir, orders_dir, gutschrifts_dir)
+
+    return jsonify({'job_id': job_id}), 202
 
+def process_job(job_id, temp_dir, orders_dir, gutschrifts_dir):
+    """Фоновая обработка загруженных документов с обновлением статуса задачи"""
+    try:
         # Парсинг документов
-        processing_status['progress'] = 30
-        processing_status['message'] = 'Обрабатываю документы...'
+        update_job_status(job_id, progress=30, message='Обрабатываю документы...')
 
-        processor = FinalDocumentProcessor()
+        # Общий base_path для всех задач: кэш разобранных PDF (logs/_cache)
+        # переживает запросы, и повторно загруженные файлы не парсятся заново
+        processor = FinalDocumentProcessor(parent_dir)
 
         # Установка пользовательских путей для документов
         processor.orders_path = Path(orders_dir)
         processor.gutschrifts_path = Path(gutschrifts_dir)
 
-        print(f"📁 Orders directory: {orders_dir}")
-        print(f"   Files: {list(Path(orders_dir).glob('*.pdf'))}")
-        print(f"📁 Gutschrifts directory: {gutschrifts_dir}")
-        print(f"   Files: {list(Path(gutschrifts_dir).glob('*.pdf'))}")
-
         # Загрузка документов
-        processing_status['progress'] = 40
-        processing_status['message'] = 'Загружаю документы...'
+        update_job_status(job_id, progress=40, message='Загружаю документы...')
         processor.load_documents()
 
-        processing_status['details']['parsed_orders'] = len(processor.transport_orders)
-        processing_status['details']['parsed_gutschrifts'] = len(processor.gutschrifts)
+        update_job_status(job_id, details={
+            'parsed_orders': len(processor.transport_orders),
+            'parsed_gutschrifts': len(processor.gutschrifts)
+        })
 
         # Сопоставление документов
-        processing_status['progress'] = 60
-        processing_status['message'] = 'Сопоставляю заказы с гутшрифтами...'
+        update_job_status(job_id, progress=60, message='Сопоставляю заказы с гутшрифтами...')
         processor.match_documents()
 
         # Генерация отчета
-        processing_status['progress'] = 80
-        processing_status['message'] = 'Генерирую отчет...'
+        update_job_status(job_id, progress=80, message='Генерирую отчет...')
         matched_df = processor.generate_report()
 
         # Подготовка статистики
@@ -134,23 +191,24 @@ def upload_files():
         }
 
         # Генерация Excel отчета
-        processing_status['progress'] = 90
-        processing_status['message'] = 'Генерирую Excel отчет...'
+        update_job_status(job_id, progress=90, message='Генерирую Excel отчет...')
 
+        # job_id в имени: параллельные задачи не перезаписывают отчеты друг друга
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         output_dir = Path(parent_dir) / 'output'
         output_dir.mkdir(exist_ok=True)
-        output_file = output_dir / f'transtar_web_{timestamp}.xlsx'
+        output_file = output_dir / f'transtar_web_{timestamp}_{job_id[:8]}.xlsx'
 
         # Экспорт в Excel используя метод процессора
         processor.export_to_excel_custom(matched_df, str(output_file), stats)
 
         # Завершение обработки
-        processing_status = {
-            'status': 'completed',
-            'progress': 100,
-            'message': 'Обработка завершена успешно!',
-            'details': {
+        set_job_status(
+            job_id,
+            status='completed',
+            progress=100,
+            message='Обработка завершена успешно!',
+            details={
                 'orders_count': stats.get('orders_count', 0),
                 'gutschrifts_count': stats.get('gutschrifts_count', 0),
                 'matched_count': stats.get('matched_count', 0),
@@ -158,58 +216,76 @@ def upload_files():
                 'output_file': str(output_file.name),
                 'statistics': stats
             }
-        }
-
-        # Очистка временных файлов
-        shutil.rmtree(temp_dir)
-
-        return jsonify({
-            'success': True,
-            'file': str(output_file.name),
-            'stats': processing_status['details']
-        })
+        )
 
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
 
-        processing_status = {
-            'status': 'error',
-            'progress': 0,
-            'message': f'Ошибка: {str(e)}',
-            'details': {
+        set_job_status(
+            job_id,
+            status='error',
+            progress=0,
+            message=f'Ошибка: {str(e)}',
+            details={
                 'error_type': type(e).__name__,
                 'traceback': error_traceback
             }
-        }
+        )
 
         print(f"ERROR: {str(e)}")
         print(f"TRACEBACK:\n{error_traceback}")
 
-        return jsonify({'error': str(e), 'traceback': error_traceback}), 500
+    finally:
+        # Очистка временных файлов
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
-@app.route('/status')
-def get_status():
-    """Получение текущего статуса обработки"""
-    return jsonify(processing_status)
+@app.route('/status/<job_id>')
+def get_job(job_id):
+    """Статус задачи по ее job_id"""
+    status = get_job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(status)
 
 @app.route('/download/<filename>')
 def download_file(filename):
     """Скачивание готового Excel файла"""
     try:
-        file_path = Path(parent_dir) / 'output' / filename
-        if file_path.exists():
-            return send_file(
-                str(file_path),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=filename
-            )
-        else:
-            return jsonify({'error': 'Файл не найден'}), 404
+        # send_from_directory отклоняет пути вне output, отдает файл через
+        # sendfile и поддерживает Range-запросы (докачку) благодаря conditional
+        return send_from_directory(
+            Path(parent_dir).resolve() / 'output',
+            filename,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            conditional=True,
+            download_name=filename
+        )
+    except NotFound:
+        return jsonify({'error': 'Файл не найден'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@functools.lru_cache(maxsize=1)
+def list_history(output_dir, ttl_bucket, dir_mtime_ns):
+    """Последние 10 отчетов в папке output (один stat на файл через os.scandir)"""
+    reports = []
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.xlsx') and entry.is_file():
+                reports.append((entry.name, entry.stat()))
+    reports.sort(key=lambda report: report[1].st_mtime, reverse=True)
+
+    return [
+        {
+            'name': name,
+            'size': f"{stat.st_size / 1024:.1f} KB",
+            'date': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+        }
+        for name, stat in reports[:10]
+    ]
+
 @app.route('/history')
 def get_history():
     """Получение истории обработанных файлов"""
@@ -217,12 +293,12 @@ def get_history():
         output_dir = Path(parent_dir) / 'output'
         files = []
         if output_dir.exists():
-            for file in sorted(output_dir.glob('*.xlsx'), key=os.path.getmtime, reverse=True)[:10]:
-                files.append({
-                    'name': file.name,
-                    'size': f"{file.stat().st_size / 1024:.1f} KB",
-                    'date': datetime.fromtimestamp(file.stat().st_mtime).strftime('%Y-%m-%d %H:%M')
-                })
+            # Ключ кэша: интервал HISTORY_TTL и mtime папки (меняется при создании/удалении отчетов)
+            files = list_history(
+                str(output_dir),
+                int(time.monotonic() // HISTORY_TTL),
+                output_dir.stat().st_mtime_ns
+            )
         return jsonify(files)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -241,6 +317,7 @@ if __name__ == '__main__':
     print("\nДля остановки нажмите Ctrl+C")
     print("=" * 60)
 
-    # В production не используем debug
-    debug_mode = os.environ.get('DEBUG', 'False').lower() == 'true'
+    # Встроенный сервер - только для локальной разработки, в production - gunicorn (wsgi.py);
+    # debug включается только при FLASK_ENV=development
+    debug_mode = os.environ.get('FLASK_ENV') == 'development'
     app.run(debug=debug_mode, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers (gunicorn)
+
+    gunicorn -w 1 -k gthread --threads 8 --timeout 300 wsgi:app
+
+Job status is kept in process memory, so run a single worker process
+and scale with threads.
+"""
+from web_app.app import app
+
+if __name__ == '__main__':
+    print("Run with: gunicorn -w 1 -k gthread --threads 8 --timeout 300 wsgi:app")